@@ -13,22 +13,45 @@ CONFIGURAZIONE:
 3. Assicurati che il bot sia amministratore sia nel canale che nel gruppo
 """
 
+import os
 import re
+import io
+import sys
+import csv
 import json
 import logging
+import logging.handlers
+import time
+import queue
+import signal
+import atexit
 import asyncio
+import argparse
+import tempfile
+import unicodedata
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Tuple
-from telegram import Update, Message
+from types import MappingProxyType
+from collections import Counter
+from typing import (
+    Optional, Dict, Tuple, List, Set, Iterable, Iterator, TextIO, Mapping, NamedTuple
+)
+from telegram import Update, Message, ChatMember
 from telegram.ext import (
     Application,
+    ApplicationHandlerStop,
     MessageHandler,
     CommandHandler,
+    TypeHandler,
     filters,
     ContextTypes,
     CallbackContext
 )
-from telegram.error import TelegramError
+from telegram.error import TelegramError, Forbidden, BadRequest
+
+try:
+    import fcntl  # Solo Unix: necessario per la modalità HA
+except ImportError:
+    fcntl = None
 
 # ============================================================================
 # CONFIGURAZIONE - MODIFICA QUESTI VALORI
@@ -41,18 +64,115 @@ CHANNEL_ID = -1002961437586  # ID del canale
 # CONFIGURAZIONE LOGGING
 # ============================================================================
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
+LOG_FORMAT = "json"  # "json" (una riga JSON per evento) oppure "testo"
+LOG_LEVELS = {
+    "": "INFO",  # Livello di default
+    "fantabot.offerte": "INFO",  # Parsing e registrazione offerte (DEBUG = ogni passaggio)
+    "fantabot.aste": "INFO",  # Creazione, pianificazione e chiusura aste
+    "fantabot.dati": "INFO",  # Persistenza su file
+    "fantabot.rose": "INFO",  # Rose e validazione svincoli
+    "fantabot.ha": "INFO",  # Lease e failover
+    "httpx": "WARNING",  # Una riga per ogni richiesta HTTP a Telegram
+}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formatta ogni evento come una riga JSON, inclusi i campi passati con extra="""
+
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in self.RESERVED})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler che accoda il record così com'è: messaggio, argomenti ed
+    eccezione vengono formattati solo dal thread del QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging() -> None:
+    """
+    Configura il logging: formattazione e scrittura avvengono in un thread
+    dedicato (QueueListener), così non bloccano il loop asyncio.
+    """
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name or None).setLevel(level)
+
+    listener.start()
+    atexit.register(listener.stop)
+
+
+setup_logging()
+logger = logging.getLogger("fantabot")
+offer_logger = logger.getChild("offerte")
+auction_logger = logger.getChild("aste")
+data_logger = logger.getChild("dati")
+roster_logger = logger.getChild("rose")
+ha_logger = logger.getChild("ha")
 
 # ============================================================================
 # CONFIGURAZIONE ASTA
 # ============================================================================
 
 AUCTION_DURATION_HOURS = 12  # Durata asta in ore
+
+# Politica di scadenza:
+# "reset" - ogni offerta riporta la scadenza a AUCTION_DURATION_HOURS
+# "estensione" - scadenza fissa, le offerte negli ultimi EXTENSION_WINDOW_MINUTES
+#                la prolungano fino a EXTENSION_MINUTES da adesso
+DEADLINE_POLICY = "reset"
+EXTENSION_WINDOW_MINUTES = 10  # Finestra finale in cui un'offerta prolunga l'asta
+EXTENSION_MINUTES = 10  # Tempo garantito dopo un'offerta nella finestra finale
+MAX_AUCTION_HOURS = None  # Durata massima totale dalla creazione (None = nessun limite)
 DATA_FILE = "auctions_data.json"  # File per persistenza dati
+ROSTERS_FILE = "rose.csv"  # File CSV delle rose (fantallenatore,giocatore)
+ROSTER_SUGGESTION_THRESHOLD = 0.35  # Similarità minima per suggerire un giocatore
+EXPORT_CHUNK_SIZE = 64 * 1024  # Dimensione blocchi di lettura per l'esportazione
+
+# Limiti anti-flood (token bucket)
+USER_RATE_PER_MINUTE = 20  # Messaggi al minuto per utente
+USER_BURST = 5  # Messaggi consecutivi consentiti per utente
+CHAT_RATE_PER_MINUTE = 120  # Messaggi al minuto per gruppo
+CHAT_BURST = 30  # Messaggi consecutivi consentiti per gruppo
+OVERLOAD_THRESHOLD = 0.25  # Sotto questa frazione di CHAT_BURST il gruppo è sovraccarico
+
+# Conferma delle offerte:
+# "entrambi" (reazione + messaggio), "reazione", "risposta",
+# "riepilogo" (reazione + riepilogo periodico per asta)
+CONFIRMATION_POLICY = "entrambi"
+DIGEST_INTERVAL_SECONDS = 300  # Intervallo del riepilogo offerte
+
+# Alta affidabilità: più istanze sulla stessa macchina, una sola attiva
+HA_MODE = False  # Attiva con True oppure avviando con --ha
+LOCK_FILE = "bot.lock"  # File del lease condiviso tra le istanze
+HA_POLL_SECONDS = 1  # Ogni quanto un'istanza di riserva riprova a prendere il lease
+HEARTBEAT_SECONDS = 10  # Ogni quanto l'istanza attiva aggiorna il lease
+LEASE_TIMEOUT_SECONDS = 3 * HEARTBEAT_SECONDS  # Senza heartbeat per tanto, l'istanza attiva è bloccata
 
 # ============================================================================
 # GESTIONE PERSISTENZA DATI
@@ -64,21 +184,104 @@ def load_auctions() -> Dict:
         with open(DATA_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
-        logger.info("File dati non trovato, creazione nuovo database")
+        data_logger.info("File dati non trovato, creazione nuovo database")
         return {}
     except json.JSONDecodeError:
-        logger.error("Errore nel parsing del JSON, creazione nuovo database")
+        data_logger.error("Errore nel parsing del JSON, creazione nuovo database")
         return {}
 
 
-def save_auctions(auctions: Dict) -> None:
-    """Salva i dati delle aste nel file JSON"""
+def _json_default(value):
+    """Serializza le strutture di sola lettura degli snapshot senza copiarle in profondità"""
+    if isinstance(value, MappingProxyType):
+        return dict(value)
+    raise TypeError(f"Tipo non serializzabile: {type(value).__name__}")
+
+
+def save_auctions(auctions: Mapping) -> None:
+    """Salva i dati delle aste nel file JSON (accetta anche snapshot immutabili)"""
     try:
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(auctions, f, ensure_ascii=False, indent=2)
-        logger.info("Dati salvati correttamente")
+        # Scrittura atomica: chi legge il file (es. esportazione) non vede mai
+        # un salvataggio a metà
+        tmp_file = f"{DATA_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(auctions, f, ensure_ascii=False, indent=2, default=_json_default)
+        os.replace(tmp_file, DATA_FILE)
+        data_logger.debug("Dati salvati correttamente")
     except Exception as e:
-        logger.error(f"Errore nel salvataggio dei dati: {e}")
+        data_logger.error("Errore nel salvataggio dei dati: %s", e)
+
+
+# ============================================================================
+# STATO ASTE (SNAPSHOT IMMUTABILI)
+# ============================================================================
+
+def _freeze(value):
+    """Converte dict/list in strutture di sola lettura"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    """Converte uno snapshot in dict/list modificabili (e serializzabili)"""
+    if isinstance(value, Mapping):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class AuctionSnapshot(NamedTuple):
+    """Versione immutabile dello stato delle aste"""
+    version: int
+    auctions: Mapping[str, Mapping]
+
+
+class AuctionStore:
+    """
+    Stato delle aste in memoria, pubblicato come snapshot immutabili e versionati.
+
+    I comandi di sola lettura usano l'ultimo snapshot senza lock. Le scritture
+    sono serializzate da `write_lock` e ogni commit pubblica una nuova versione
+    copiando solo le aste modificate: le altre sono condivise con lo snapshot
+    precedente.
+    """
+
+    def __init__(self) -> None:
+        self._snapshot = AuctionSnapshot(0, MappingProxyType({}))
+        self.write_lock = asyncio.Lock()
+
+    def load(self) -> None:
+        """Carica le aste dal file e pubblica il primo snapshot"""
+        auctions = {k: _freeze(v) for k, v in load_auctions().items()}
+        self._snapshot = AuctionSnapshot(self._snapshot.version + 1, MappingProxyType(auctions))
+
+    def snapshot(self) -> AuctionSnapshot:
+        """Ritorna l'ultimo snapshot pubblicato"""
+        return self._snapshot
+
+    def get_for_update(self, auction_key: str) -> Optional[Dict]:
+        """Ritorna una copia modificabile dell'asta (da passare a commit)"""
+        auction = self._snapshot.auctions.get(auction_key)
+        return _thaw(auction) if auction is not None else None
+
+    def commit(self, changes: Dict[str, Dict]) -> AuctionSnapshot:
+        """Salva le aste modificate e pubblica il nuovo snapshot"""
+        auctions = dict(self._snapshot.auctions)
+        for auction_key, auction in changes.items():
+            auctions[auction_key] = _freeze(auction)
+
+        # Lo snapshot immutabile viene serializzato direttamente, senza copie
+        save_auctions(auctions)
+
+        self._snapshot = AuctionSnapshot(self._snapshot.version + 1, MappingProxyType(auctions))
+        return self._snapshot
+
+
+store = AuctionStore()
 
 
 # ============================================================================
@@ -93,13 +296,14 @@ def parse_offer(text: str) -> Optional[Tuple[int, str]]:
     - "15 svincolo Belotti"
     - "10 per Lukaku svincolo Zaza"
     - "20 svincolo nessuno"
+    - "12 svincolo De Roon" (nomi composti da più parole)
     
     Returns:
         Tuple[int, str] con (cifra, nome_svincolo) oppure None se non trovato
     """
-    # Pattern per trovare: numero + "svincolo" + nome
+    # Pattern per trovare: numero + "svincolo" + nome (tutto il resto della riga)
     # Supporta "X svincolo Y" oppure "X per Z svincolo Y"
-    pattern = r'(\d+).*?svincolo\s+(.+?)(?:\s|$)'
+    pattern = r'(\d+).*?svincolo\s+(.+)'
     
     match = re.search(pattern, text.lower())
     
@@ -109,18 +313,425 @@ def parse_offer(text: str) -> Optional[Tuple[int, str]]:
             svincolo = match.group(2).strip().title()
             
             # Rimuove eventuali punteggiatura finale
-            svincolo = re.sub(r'[.,!?]$', '', svincolo)
+            svincolo = re.sub(r'[\s.,!?]+$', '', svincolo)
+            
+            # "15 svincolo ." non indica nessun giocatore
+            if not svincolo:
+                offer_logger.debug("Svincolo mancante nel testo: %s", text)
+                return None
             
-            logger.info(f"Offerta parsata: {cifra} crediti, svincolo: {svincolo}")
+            offer_logger.debug("Offerta parsata: %d crediti, svincolo: %s", cifra, svincolo)
             return (cifra, svincolo)
         except ValueError:
-            logger.warning(f"Valore numerico non valido nel testo: {text}")
+            offer_logger.warning("Valore numerico non valido nel testo: %s", text)
             return None
     
-    logger.warning(f"Nessuna offerta trovata nel testo: {text}")
+    offer_logger.debug("Nessuna offerta trovata nel testo: %s", text)
     return None
 
 
+def parse_auction_player(text: str) -> Optional[str]:
+    """
+    Estrae il giocatore messo all'asta dal testo del post nel canale.
+
+    Formato: "Ronaldo 1 svincolo Belotti" -> "Ronaldo"
+    """
+    match = re.match(r'\s*(.+?)\s+\d+', text)
+    if not match:
+        return None
+    return match.group(1).strip().title()
+
+
+# ============================================================================
+# GESTIONE ROSE
+# ============================================================================
+
+def normalize_name(name: str) -> str:
+    """Normalizza un nome: minuscolo, senza accenti né punteggiatura"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    folded = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    folded = re.sub(r'[^a-z0-9]+', ' ', folded.lower())
+    return folded.strip()
+
+
+def normalize_username(username: str) -> str:
+    """Normalizza il nome di un fantallenatore (senza @, minuscolo)"""
+    return username.strip().lstrip('@').lower()
+
+
+def _trigrams(normalized: str) -> Set[str]:
+    """Calcola i trigrammi di un nome già normalizzato"""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RosterMatch(NamedTuple):
+    """Risultato della ricerca di un giocatore nella rosa"""
+    player: Optional[str] = None  # Giocatore trovato
+    suggestion: Optional[str] = None  # Giocatore più simile, se non trovato
+    candidates: Tuple[str, ...] = ()  # Più giocatori corrispondenti (ambiguo)
+
+
+class RosterIndex:
+    """
+    Indice precalcolato delle rose dei fantallenatori.
+
+    Per ogni fantallenatore mantiene i nomi normalizzati dei giocatori e un
+    indice a trigrammi per il matching approssimato. L'indice viene
+    aggiornato in modo incrementale quando una rosa cambia.
+    """
+
+    def __init__(self) -> None:
+        # fantallenatore -> {nome normalizzato: nome visualizzato}
+        self._players: Dict[str, Dict[str, str]] = {}
+        # fantallenatore -> {trigramma: {nomi normalizzati}}
+        self._trigrams: Dict[str, Dict[str, Set[str]]] = {}
+
+    def has_roster(self, username: str) -> bool:
+        return normalize_username(username) in self._players
+
+    def managers(self) -> List[str]:
+        return list(self._players)
+
+    def players(self, username: str) -> List[str]:
+        return sorted(self._players.get(normalize_username(username), {}).values())
+
+    def add_player(self, username: str, player: str) -> None:
+        """Aggiunge un giocatore alla rosa e ai trigrammi dell'indice"""
+        manager = normalize_username(username)
+        normalized = normalize_name(player)
+        if not normalized:
+            return
+        players = self._players.setdefault(manager, {})
+        if normalized in players:
+            return
+        players[normalized] = player.strip()
+        postings = self._trigrams.setdefault(manager, {})
+        for trigram in _trigrams(normalized):
+            postings.setdefault(trigram, set()).add(normalized)
+
+    def remove_player(self, username: str, player: str) -> bool:
+        """Rimuove un giocatore dalla rosa. Ritorna False se non presente"""
+        manager = normalize_username(username)
+        normalized = normalize_name(player)
+        players = self._players.get(manager)
+        if not players or normalized not in players:
+            return False
+        del players[normalized]
+        postings = self._trigrams[manager]
+        for trigram in _trigrams(normalized):
+            names = postings.get(trigram)
+            if names is not None:
+                names.discard(normalized)
+                if not names:
+                    del postings[trigram]
+        return True
+
+    def replace_roster(self, username: str, players: Iterable[str]) -> None:
+        """Sostituisce la rosa aggiornando solo i giocatori cambiati"""
+        manager = normalize_username(username)
+        wanted = {normalize_name(p): p.strip() for p in players if normalize_name(p)}
+        current = self._players.setdefault(manager, {})
+        self._trigrams.setdefault(manager, {})
+        for normalized in set(current) - set(wanted):
+            self.remove_player(manager, current[normalized])
+        for normalized, player in wanted.items():
+            if normalized not in current:
+                self.add_player(manager, player)
+
+    def resolve(self, username: str, name: str) -> RosterMatch:
+        """
+        Cerca un giocatore nella rosa del fantallenatore.
+
+        Returns:
+            RosterMatch con il giocatore se trovato, i candidati se il nome
+            corrisponde a più giocatori, altrimenti il suggerimento più simile
+            (o nessuno se non c'è un nome abbastanza vicino)
+        """
+        manager = normalize_username(username)
+        players = self._players.get(manager, {})
+        normalized = normalize_name(name)
+        if normalized in players:
+            return RosterMatch(player=players[normalized])
+
+        # Match per parole intere: "Belotti" -> "Andrea Belotti",
+        # "De Roon" -> "Marten De Roon"
+        by_token = sorted(p for n, p in players.items() if f" {normalized} " in f" {n} ")
+        if len(by_token) == 1:
+            return RosterMatch(player=by_token[0])
+        if len(by_token) > 1:
+            return RosterMatch(candidates=tuple(by_token))
+
+        query = _trigrams(normalized)
+        postings = self._trigrams.get(manager, {})
+        shared: Set[str] = set()
+        for trigram in query:
+            shared.update(postings.get(trigram, ()))
+
+        # Similarità di Jaccard sul nome completo o sul singolo cognome/nome;
+        # a parità di punteggio vince il primo in ordine alfabetico
+        best, best_score = None, 0.0
+        for candidate in sorted(shared):
+            score = max(
+                len(query & grams) / len(query | grams)
+                for grams in [_trigrams(candidate)] + [_trigrams(t) for t in candidate.split()]
+            )
+            if score > best_score:
+                best, best_score = candidate, score
+
+        if best is not None and best_score >= ROSTER_SUGGESTION_THRESHOLD:
+            return RosterMatch(suggestion=players[best])
+        return RosterMatch()
+
+    def resolve_leading(self, username: str, text: str) -> RosterMatch:
+        """
+        Come resolve, ma se il testo completo non corrisponde prova le sequenze
+        iniziali di parole, dalla più lunga: "Belotti grazie" -> "Belotti".
+        Se nessuna corrisponde ritorna il risultato del testo completo.
+        """
+        match = self.resolve(username, text)
+        if match.player or match.candidates:
+            return match
+
+        words = text.split()
+        for length in range(len(words) - 1, 0, -1):
+            leading = self.resolve(username, ' '.join(words[:length]))
+            if leading.player or leading.candidates:
+                return leading
+        return match
+
+
+roster_index = RosterIndex()
+
+
+def parse_rosters_csv(lines: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Legge le rose da CSV con colonne: fantallenatore,giocatore
+    L'intestazione è opzionale.
+    """
+    rosters: Dict[str, List[str]] = {}
+    for row in csv.reader(lines):
+        if len(row) < 2 or not row[0].strip() or not row[1].strip():
+            continue
+        manager, player = row[0].strip(), row[1].strip()
+        if manager.lower() == 'fantallenatore' and player.lower() == 'giocatore':
+            continue
+        rosters.setdefault(manager, []).append(player)
+    return rosters
+
+
+def load_rosters() -> None:
+    """Carica le rose dal file CSV nell'indice"""
+    try:
+        with open(ROSTERS_FILE, 'r', encoding='utf-8', newline='') as f:
+            rosters = parse_rosters_csv(f)
+    except FileNotFoundError:
+        roster_logger.info("File rose non trovato, validazione svincoli disattivata")
+        return
+
+    for manager, players in rosters.items():
+        roster_index.replace_roster(manager, players)
+    roster_logger.info("Rose caricate: %d fantallenatori", len(rosters))
+
+
+def save_rosters() -> None:
+    """Salva le rose dell'indice nel file CSV"""
+    try:
+        with open(ROSTERS_FILE, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['fantallenatore', 'giocatore'])
+            for manager in roster_index.managers():
+                for player in roster_index.players(manager):
+                    writer.writerow([manager, player])
+    except Exception as e:
+        roster_logger.error("Errore nel salvataggio delle rose: %s", e)
+
+
+def update_rosters_after_close(auction: Dict) -> None:
+    """Aggiorna la rosa del vincitore: rimuove lo svincolo e aggiunge il giocatore"""
+    username = auction.get('username', 'Nessuno')
+    if username == 'Nessuno' or not roster_index.has_roster(username):
+        return
+
+    svincolo = auction.get('svincolo', '')
+    if normalize_name(svincolo) not in ('nessuno', 'da definire'):
+        roster_index.remove_player(username, svincolo)
+
+    player = parse_auction_player(auction.get('original_text', ''))
+    if player:
+        roster_index.add_player(username, player)
+
+    save_rosters()
+    roster_logger.info("Rosa di %s aggiornata dopo la chiusura dell'asta", username)
+
+
+async def is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Verifica se l'autore del messaggio è amministratore del gruppo"""
+    message = update.message
+
+    # Admin anonimi: il messaggio è inviato a nome del gruppo stesso
+    if message.sender_chat and message.sender_chat.id == message.chat.id:
+        return True
+
+    try:
+        member = await context.bot.get_chat_member(message.chat.id, message.from_user.id)
+    except TelegramError as e:
+        logger.warning("Impossibile verificare i permessi: %s", e)
+        return False
+
+    return member.status in (ChatMember.ADMINISTRATOR, ChatMember.OWNER)
+
+
+# ============================================================================
+# ESPORTAZIONE STORICO
+# ============================================================================
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_CSV_FIELDS = [
+    'tipo', 'asta', 'giocatore', 'fantallenatore', 'offerta', 'svincolo',
+    'scadenza', 'data', 'attiva', 'creata_da', 'testo'
+]
+
+
+def iter_auctions(path: str = DATA_FILE) -> Iterator[Tuple[str, Dict]]:
+    """
+    Legge le aste dal file JSON una alla volta, a blocchi, senza caricare
+    l'intero file in memoria.
+    """
+    decoder = json.JSONDecoder()
+
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+
+    with f:
+        buf, pos = '', 0
+
+        def next_char() -> str:
+            # Salta gli spazi e ritorna il prossimo carattere ('' a fine file)
+            nonlocal buf, pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf):
+                    return buf[pos]
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    return ''
+                buf, pos = chunk, 0
+
+        def next_value():
+            # Decodifica il prossimo valore, leggendo altri blocchi se incompleto
+            nonlocal buf, pos
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    value, end = None, None
+                # Un valore completo è sempre seguito da ',' ':' o '}'
+                if end is not None and end < len(buf):
+                    break
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    if end is None:
+                        raise ValueError(f"JSON non valido in {path}")
+                    break
+                buf, pos = buf[pos:] + chunk, 0
+            pos = end
+            return value
+
+        def expect(chars: str) -> str:
+            nonlocal pos
+            c = next_char()
+            if not c or c not in chars:
+                raise ValueError(f"JSON non valido in {path}: atteso {chars!r}")
+            pos += 1
+            return c
+
+        if not next_char():
+            return
+        expect('{')
+        if next_char() == '}':
+            return
+
+        while True:
+            key = next_value()
+            expect(':')
+            yield key, next_value()
+            if expect(',}') == '}':
+                return
+
+
+def iter_export_rows(auctions: Iterable[Tuple[str, Dict]]) -> Iterator[Dict]:
+    """Genera le righe di esportazione: una per asta e una per ogni offerta"""
+    for key, auction in auctions:
+        original_text = auction.get('original_text', '')
+        player = parse_auction_player(original_text) or ''
+        yield {
+            'tipo': 'asta',
+            'asta': key,
+            'giocatore': player,
+            'fantallenatore': auction.get('username', 'Nessuno'),
+            'offerta': auction.get('current_offer', 0),
+            'svincolo': auction.get('svincolo', ''),
+            'scadenza': auction.get('deadline', ''),
+            'data': '',
+            'attiva': auction.get('active', False),
+            'creata_da': auction.get('created_by', ''),
+            'testo': original_text
+        }
+        for bid in auction.get('bids', []):
+            yield {
+                'tipo': 'offerta',
+                'asta': key,
+                'giocatore': player,
+                'fantallenatore': bid.get('username', ''),
+                'offerta': bid.get('offer', 0),
+                'svincolo': bid.get('svincolo', ''),
+                'scadenza': '',
+                'data': bid.get('timestamp', ''),
+                'attiva': '',
+                'creata_da': '',
+                'testo': ''
+            }
+
+
+def iter_export_lines(fmt: str, path: str = DATA_FILE) -> Iterator[str]:
+    """Genera le linee del file esportato nel formato richiesto (csv o jsonl)"""
+    if fmt == 'jsonl':
+        for key, auction in iter_auctions(path):
+            yield json.dumps({'asta': key, **auction}, ensure_ascii=False) + '\n'
+        return
+
+    # Il buffer contiene una sola riga alla volta
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_CSV_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    for row in iter_export_rows(iter_auctions(path)):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+def export_auctions(fmt: str, out: TextIO, path: str = DATA_FILE) -> int:
+    """
+    Esporta lo storico delle aste su un file aperto.
+
+    Returns:
+        Numero di record esportati (intestazione CSV esclusa)
+    """
+    count = 0
+    for line in iter_export_lines(fmt, path):
+        out.write(line)
+        count += 1
+    return count - 1 if fmt == 'csv' else count
+
+
 # ============================================================================
 # FORMATTAZIONE DIDASCALIA
 # ============================================================================
@@ -202,24 +813,24 @@ async def cmd_asta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     
     try:
         # Salva l'asta
-        auctions = load_auctions()
         group_message_id = replied_message.message_id
         auction_key = f"group_{group_message_id}"
         
-        scadenza = datetime.now() + timedelta(hours=AUCTION_DURATION_HOURS)
-        
-        auctions[auction_key] = {
-            'group_message_id': group_message_id,
-            'original_text': auction_text,
-            'current_offer': 0,
-            'username': 'Nessuno',
-            'svincolo': 'Da definire',
-            'active': True,
-            'deadline': scadenza.isoformat(),
-            'created_by': message.from_user.username or message.from_user.first_name
-        }
+        created_at = datetime.now()
+        scadenza = initial_deadline(created_at)
         
-        save_auctions(auctions)
+        async with store.write_lock:
+            store.commit({auction_key: {
+                'group_message_id': group_message_id,
+                'original_text': auction_text,
+                'current_offer': 0,
+                'username': 'Nessuno',
+                'svincolo': 'Da definire',
+                'active': True,
+                'deadline': scadenza.isoformat(),
+                'created_at': created_at.isoformat(),
+                'created_by': message.from_user.username or message.from_user.first_name
+            }})
         
         await message.reply_text(
             f"✅ **Asta avviata!**\n\n"
@@ -227,20 +838,14 @@ async def cmd_asta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"Fate le vostre offerte!"
         )
         
-        logger.info(f"Asta creata - Gruppo ID: {group_message_id}")
+        auction_logger.info("Asta creata - Gruppo ID: %s", group_message_id, extra={'asta': auction_key})
         
         # Pianifica chiusura
         if context.job_queue:
-            job_name = f"close_auction_{auction_key}"
-            context.job_queue.run_once(
-                close_auction,
-                when=AUCTION_DURATION_HOURS * 3600,
-                data={'auction_key': auction_key},
-                name=job_name
-            )
+            schedule_auction_close(context.job_queue, auction_key, scadenza)
         
     except Exception as e:
-        logger.error(f"Errore nella creazione dell'asta: {e}")
+        auction_logger.error("Errore nella creazione dell'asta: %s", e)
         await message.reply_text(f"❌ Errore: {e}")
 
 
@@ -265,8 +870,8 @@ async def cmd_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text("❌ Questo non è un messaggio di asta dal canale!")
         return
     
-    # Cerca l'asta
-    auctions = load_auctions()
+    # Cerca l'asta (lettura dall'ultimo snapshot, senza lock)
+    auctions = store.snapshot().auctions
     auction_found = None
     auction_key = None
     
@@ -311,7 +916,7 @@ async def cmd_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         
     except Exception as e:
-        logger.error(f"Errore nel calcolo del tempo: {e}")
+        logger.error("Errore nel calcolo del tempo: %s", e)
         await message.reply_text(f"❌ Errore: {e}")
 
 
@@ -334,7 +939,7 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text("❌ Questo non è un messaggio di asta dal canale!")
         return
     
-    auctions = load_auctions()
+    auctions = store.snapshot().auctions
     auction_found = None
     
     # Cerca l'asta corrispondente
@@ -383,7 +988,7 @@ async def cmd_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text(info_text)
         
     except Exception as e:
-        logger.error(f"Errore nel recupero info: {e}")
+        logger.error("Errore nel recupero info: %s", e)
         await message.reply_text(f"❌ Errore: {e}")
 
 
@@ -409,25 +1014,27 @@ async def cmd_chiudi(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await message.reply_text("❌ Questo non è un messaggio di asta dal canale!")
         return
     
-    auctions = load_auctions()
     auction_key = None
     auction_found = None
     
-    for key, auction in auctions.items():
-        if auction.get('active'):
-            auction_found = auction
-            auction_key = key
-            break
+    async with store.write_lock:
+        for key, auction in store.snapshot().auctions.items():
+            if auction.get('active'):
+                auction_key = key
+                break
+        
+        if auction_key:
+            # Chiudi l'asta
+            auction_found = store.get_for_update(auction_key)
+            auction_found['active'] = False
+            store.commit({auction_key: auction_found})
     
     if not auction_found:
         await message.reply_text("❌ Asta non trovata o già chiusa!")
         return
     
     try:
-        # Chiudi l'asta
-        auction_found['active'] = False
-        auctions[auction_key] = auction_found
-        save_auctions(auctions)
+        update_rosters_after_close(auction_found)
         
         # Rimuovi il job di chiusura automatica (se esiste)
         if context.job_queue:
@@ -443,10 +1050,10 @@ async def cmd_chiudi(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             f"🔄 Svincolo: {auction_found['svincolo']}"
         )
         
-        logger.info(f"Asta {auction_key} chiusa manualmente")
+        auction_logger.info("Asta %s chiusa manualmente", auction_key, extra={'asta': auction_key})
         
     except Exception as e:
-        logger.error(f"Errore nella chiusura manuale: {e}")
+        auction_logger.error("Errore nella chiusura manuale: %s", e)
         await message.reply_text(f"❌ Errore: {e}")
 
 
@@ -456,7 +1063,7 @@ async def cmd_aste(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     message = update.message
     
-    auctions = load_auctions()
+    auctions = store.snapshot().auctions
     active_auctions = {k: v for k, v in auctions.items() if v.get('active', False)}
     
     if not active_auctions:
@@ -481,7 +1088,7 @@ async def cmd_aste(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text(aste_text)
         
     except Exception as e:
-        logger.error(f"Errore nel recupero aste: {e}")
+        logger.error("Errore nel recupero aste: %s", e)
         await message.reply_text(f"❌ Errore: {e}")
 
 
@@ -491,7 +1098,7 @@ async def cmd_classifica(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     """
     message = update.message
     
-    auctions = load_auctions()
+    auctions = store.snapshot().auctions
     
     # Conta le vittorie per utente (solo aste chiuse)
     wins = {}
@@ -529,6 +1136,131 @@ async def cmd_classifica(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await message.reply_text(classifica_text)
 
 
+async def cmd_rose(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Gestione delle rose.
+    - In risposta a un file CSV (fantallenatore,giocatore): importa le rose (solo admin)
+    - Senza risposta: mostra la propria rosa
+    """
+    message = update.message
+    replied_message = message.reply_to_message
+
+    if not (replied_message and replied_message.document):
+        username = message.from_user.username or message.from_user.first_name
+        players = roster_index.players(username)
+        if not players:
+            await message.reply_text(
+                "📭 **Nessuna rosa caricata per te.**\n\n"
+                "Un admin può importare le rose rispondendo a un file CSV con `/rose`"
+            )
+            return
+        await message.reply_text(
+            f"📋 **ROSA DI {username}**\n\n" + "\n".join(f"• {p}" for p in players)
+        )
+        return
+
+    if not await is_admin(update, context):
+        await message.reply_text("❌ Solo gli amministratori possono importare le rose!")
+        return
+
+    try:
+        document = await replied_message.document.get_file()
+        content = await document.download_as_bytearray()
+        rosters = parse_rosters_csv(content.decode('utf-8-sig').splitlines())
+
+        if not rosters:
+            await message.reply_text(
+                "❌ Nessuna rosa trovata nel file!\n"
+                "Formato: `fantallenatore,giocatore` (una riga per giocatore)"
+            )
+            return
+
+        # Aggiorna solo le rose presenti nel file
+        for manager, players in rosters.items():
+            roster_index.replace_roster(manager, players)
+        save_rosters()
+
+        await message.reply_text(
+            f"✅ **Rose importate!**\n\n"
+            f"👥 Fantallenatori: {len(rosters)}\n"
+            f"⚽ Giocatori: {sum(len(p) for p in rosters.values())}"
+        )
+        roster_logger.info("Rose importate: %d fantallenatori", len(rosters))
+
+    except Exception as e:
+        roster_logger.error("Errore nell'importazione delle rose: %s", e)
+        await message.reply_text(f"❌ Errore: {e}")
+
+
+async def cmd_esporta(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Esporta lo storico delle aste come documento inviato in privato (solo admin).
+    Uso: /esporta [csv|jsonl]
+    """
+    message = update.message
+
+    if not await is_admin(update, context):
+        await message.reply_text("❌ Solo gli amministratori possono esportare le aste!")
+        return
+
+    fmt = (context.args[0].lower() if context.args else 'csv')
+    if fmt not in EXPORT_FORMATS:
+        await message.reply_text("❌ Formato non valido! Usa: `/esporta csv` oppure `/esporta jsonl`")
+        return
+
+    fd, tmp_path = tempfile.mkstemp(suffix=f".{fmt}")
+    try:
+        # L'esportazione gira in un thread per non bloccare le offerte
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as out:
+            count = await asyncio.to_thread(export_auctions, fmt, out)
+
+        # Il file va in privato all'admin, non nel gruppo
+        filename = f"aste_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
+        try:
+            with open(tmp_path, 'rb') as f:
+                await context.bot.send_document(
+                    chat_id=message.from_user.id,
+                    document=f,
+                    filename=filename,
+                    caption=f"📦 Esportazione aste: {count} record"
+                )
+        except (Forbidden, BadRequest) as e:
+            logger.warning("Impossibile inviare l'esportazione in privato: %s", e)
+            await message.reply_text(
+                "❌ Non posso inviarti il file in privato!\n"
+                "Avvia prima una chat con il bot e riprova `/esporta`"
+            )
+            return
+
+        await message.reply_text("📬 Esportazione inviata in privato!")
+        logger.info("Esportazione %s inviata: %d record", fmt, count)
+
+    except Exception as e:
+        logger.error("Errore nell'esportazione: %s", e)
+        await message.reply_text(f"❌ Errore: {e}")
+    finally:
+        os.remove(tmp_path)
+
+
+async def cmd_stato(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Mostra lo stato del bot e i contatori dei messaggi scartati dal filtro anti-flood.
+    """
+    snapshot = store.snapshot()
+    active = sum(1 for a in snapshot.auctions.values() if a.get('active', False))
+
+    await update.message.reply_text(
+        f"🩺 **STATO BOT**\n\n"
+        f"📋 Aste attive: {active}\n"
+        f"🗂️ Versione dati: {snapshot.version}\n\n"
+        f"**🚫 Messaggi scartati:**\n"
+        f"💬 Non offerte: {shed_stats['non_offerta']}\n"
+        f"👤 Limite utente: {shed_stats['limite_utente']}\n"
+        f"👥 Comandi oltre il limite del gruppo: {shed_stats['limite_gruppo']}\n"
+        f"❌ Risposte di errore omesse: {shed_stats['risposte_errore']}"
+    )
+
+
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Mostra la guida dei comandi disponibili.
@@ -547,7 +1279,10 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "`/aste` - Lista aste attive\n\n"
         
         "**📊 Statistiche:**\n"
-        "`/classifica` - Classifica fantallenatori\n\n"
+        "`/classifica` - Classifica fantallenatori\n"
+        "`/rose` - La tua rosa (admin: rispondi a un CSV per importare)\n"
+        "`/esporta [csv|jsonl]` - Esporta lo storico delle aste (admin)\n"
+        "`/stato` - Stato del bot e messaggi scartati\n\n"
         
         "**💰 Fare un'offerta:**\n"
         "Rispondi al messaggio dell'asta (nei commenti) con:\n"
@@ -556,13 +1291,116 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         
         "**ℹ️ Info:**\n"
         f"⏱️ Durata asta: {AUCTION_DURATION_HOURS} ore\n"
-        "🔄 Ogni offerta resetta il timer\n"
+        f"{describe_deadline_policy()}\n"
         "🏆 Vince l'ultima offerta valida"
     )
     
     await update.message.reply_text(help_text)
 
 
+# ============================================================================
+# AMMISSIONE MESSAGGI (ANTI-FLOOD)
+# ============================================================================
+
+class TokenBucket:
+    """Token bucket: `burst` gettoni, ricaricati a `rate_per_minute` al minuto"""
+
+    def __init__(self, rate_per_minute: float, burst: int) -> None:
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        """Consuma un gettone se disponibile"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def level(self) -> float:
+        """Frazione di gettoni disponibili (1.0 = bucket pieno)"""
+        self._refill()
+        return self.tokens / self.capacity
+
+
+user_buckets: Dict[int, TokenBucket] = {}
+chat_buckets: Dict[int, TokenBucket] = {}
+shed_stats: Counter = Counter()  # Messaggi scartati per motivo
+
+MAX_BUCKETS = 10000  # Oltre questa soglia si eliminano i bucket inattivi
+
+
+def _get_bucket(buckets: Dict[int, TokenBucket], key: int, rate: float, burst: int) -> TokenBucket:
+    bucket = buckets.get(key)
+    if bucket is None:
+        if len(buckets) >= MAX_BUCKETS:
+            # Un bucket pieno equivale a uno nuovo: si può eliminare
+            for k in [k for k, b in buckets.items() if b.level() >= 1]:
+                del buckets[k]
+        bucket = buckets[key] = TokenBucket(rate, burst)
+    return bucket
+
+
+def is_overloaded(chat_id: int) -> bool:
+    """Il gruppo è sovraccarico se ha consumato quasi tutti i gettoni"""
+    bucket = chat_buckets.get(chat_id)
+    return bucket is not None and bucket.level() < OVERLOAD_THRESHOLD
+
+
+async def admission_gate(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Filtro economico eseguito prima di tutti gli handler.
+    Scarta senza risposta e senza consumare gettoni i messaggi che non possono
+    essere offerte; solo comandi e possibili offerte vengono conteggiati.
+    Oltre il limite del gruppo si scartano i comandi, mentre le offerte
+    passano comunque (sono le risposte di errore a essere omesse).
+    """
+    message = update.message
+    if not message or not message.from_user:
+        return
+
+    text = message.text or ""
+    is_command = text.startswith('/')
+
+    # Solo una risposta con cifre a un post del canale può essere un'offerta
+    if not is_command:
+        replied_message = message.reply_to_message
+        is_channel_reply = bool(
+            replied_message
+            and replied_message.is_automatic_forward
+            and replied_message.sender_chat
+            and replied_message.sender_chat.id == CHANNEL_ID
+        )
+        if not (is_channel_reply and any(c.isdigit() for c in text)):
+            shed_stats['non_offerta'] += 1
+            raise ApplicationHandlerStop
+
+    user_bucket = _get_bucket(user_buckets, message.from_user.id, USER_RATE_PER_MINUTE, USER_BURST)
+    if not user_bucket.try_acquire():
+        shed_stats['limite_utente'] += 1
+        raise ApplicationHandlerStop
+
+    chat_bucket = _get_bucket(chat_buckets, message.chat.id, CHAT_RATE_PER_MINUTE, CHAT_BURST)
+    if not chat_bucket.try_acquire() and is_command:
+        shed_stats['limite_gruppo'] += 1
+        raise ApplicationHandlerStop
+
+
+async def reply_error(message: Message, text: str) -> None:
+    """Risponde con un errore, a meno che il gruppo sia sovraccarico"""
+    if is_overloaded(message.chat.id):
+        shed_stats['risposte_errore'] += 1
+        return
+    await message.reply_text(text)
+
+
 # ============================================================================
 # GESTIONE OFFERTE
 # ============================================================================
@@ -582,12 +1420,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     
     # Verifica se il messaggio a cui si risponde proviene dal canale
     if replied_message.is_automatic_forward and replied_message.sender_chat and replied_message.sender_chat.id == CHANNEL_ID:
-        logger.info(f"Rilevata risposta a post del canale da {message.from_user.username}")
-        
-        # Carica i dati delle aste
-        auctions = load_auctions()
+        offer_logger.debug("Rilevata risposta a post del canale da %s", message.from_user.username)
         
-        # Cerca l'asta corrispondente
+        # Cerca l'asta corrispondente nell'ultimo snapshot
+        auctions = store.snapshot().auctions
         auction_found = None
         auction_key = None
         
@@ -595,7 +1431,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Cerchiamo prima usando il testo del messaggio per matching
         replied_text = replied_message.text or replied_message.caption or ""
         
-        logger.info(f"Cerco asta per messaggio: '{replied_text[:50]}...'")
+        offer_logger.debug("Cerco asta per messaggio: '%.50s...'", replied_text)
         
         # Cerca tra tutte le aste attive
         for key, auction in auctions.items():
@@ -604,7 +1440,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 if auction.get('original_text') == replied_text:
                     auction_found = auction
                     auction_key = key
-                    logger.info(f"Asta trovata tramite match testo: {key}")
+                    offer_logger.debug("Asta trovata tramite match testo: %s", key)
                     break
         
         # Se non trovata, prendi la prima asta attiva (fallback)
@@ -613,24 +1449,26 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 if auction.get('active', False):
                     auction_found = auction
                     auction_key = key
-                    logger.warning(f"Usato fallback - prima asta attiva: {key}")
+                    offer_logger.warning("Usato fallback - prima asta attiva: %s", key)
                     break
         
         # Verifica che l'asta sia stata trovata
         if not auction_found:
-            await message.reply_text(
+            await reply_error(
+                message,
                 "❌ **Asta non trovata!**\n\n"
                 "Assicurati che l'asta sia stata creata con `/asta`"
             )
             return
         
-        logger.info(f"Asta trovata - Key: {auction_key}")
+        offer_logger.debug("Asta trovata - Key: %s", auction_key)
         
         # Parsing dell'offerta
         offer_data = parse_offer(message.text)
         
         if not offer_data:
-            await message.reply_text(
+            await reply_error(
+                message,
                 "❌ Formato offerta non valido.\n"
                 "Usa: [Cifra] svincolo [NomeGiocatore]\n"
                 "Esempio: 15 svincolo Belotti"
@@ -640,75 +1478,264 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         cifra, svincolo = offer_data
         username = message.from_user.username or message.from_user.first_name
         
-        # auction_key è già stato trovato sopra nella ricerca
-        # Carica i dati delle aste
-        auctions = load_auctions()
-        
-        # Validazione: controlla se l'offerta è superiore all'attuale
-        current_offer = auction_found.get('current_offer', 0)
-        if current_offer > 0 and cifra <= current_offer:
-            await message.reply_text(
-                f"❌ Offerta troppo bassa!\n"
-                f"L'offerta attuale è: {current_offer} crediti"
-            )
-            return
-        
-        # Calcola la nuova scadenza
-        scadenza = datetime.now() + timedelta(hours=AUCTION_DURATION_HOURS)
-        
-        # Aggiorna i dati dell'asta (mantieni la chiave esistente)
-        auction_found['current_offer'] = cifra
-        auction_found['username'] = username
-        auction_found['svincolo'] = svincolo
-        auction_found['deadline'] = scadenza.isoformat()
+        # Validazione svincolo sulla rosa del fantallenatore (se caricata),
+        # altrimenti si tiene solo la prima parola come in passato
+        if normalize_name(svincolo).split()[:1] == ['nessuno']:
+            svincolo = 'Nessuno'
+        elif roster_index.has_roster(username):
+            match = roster_index.resolve_leading(username, svincolo)
+            if match.candidates:
+                await reply_error(
+                    message,
+                    f"❓ Nella tua rosa ci sono più giocatori per \"{svincolo}\":\n"
+                    + "\n".join(f"• {p}" for p in match.candidates)
+                    + "\n\nRiscrivi l'offerta con il nome completo."
+                )
+                return
+            if not match.player:
+                reply = f"❌ {svincolo} non è nella tua rosa!"
+                if match.suggestion:
+                    reply += f"\nForse intendevi: **{match.suggestion}**?"
+                await reply_error(message, reply)
+                return
+            svincolo = match.player
+        else:
+            svincolo = svincolo.partition(' ')[0]
         
-        auctions[auction_key] = auction_found
+        # auction_key è già stato trovato sopra nella ricerca: rileggi l'asta
+        # sotto lock, perché potrebbe essere cambiata nel frattempo
+        error_reply = None
+        async with store.write_lock:
+            auction_found = store.get_for_update(auction_key)
+            current_offer = auction_found.get('current_offer', 0)
+            now = datetime.now()
+            previous_deadline = datetime.fromisoformat(auction_found['deadline'])
+            
+            if not auction_found.get('active', False):
+                error_reply = "❌ L'asta è stata appena chiusa!"
+            elif previous_deadline <= now:
+                error_reply = "⏱️ **Asta scaduta!** Offerta non accettata."
+            # Validazione: controlla se l'offerta è superiore all'attuale
+            elif current_offer > 0 and cifra <= current_offer:
+                error_reply = (
+                    f"❌ Offerta troppo bassa!\n"
+                    f"L'offerta attuale è: {current_offer} crediti"
+                )
+            else:
+                # Calcola la nuova scadenza secondo la politica configurata
+                scadenza = next_deadline(auction_found, now)
+                
+                # Aggiorna i dati dell'asta (mantieni la chiave esistente)
+                auction_found['current_offer'] = cifra
+                auction_found['username'] = username
+                auction_found['svincolo'] = svincolo
+                auction_found['deadline'] = scadenza.isoformat()
+                auction_found.setdefault('bids', []).append({
+                    'username': username,
+                    'offer': cifra,
+                    'svincolo': svincolo,
+                    'timestamp': now.isoformat()
+                })
+                
+                # Salva i dati e pubblica il nuovo snapshot
+                store.commit({auction_key: auction_found})
         
-        # Salva i dati
-        save_auctions(auctions)
+        if error_reply:
+            await reply_error(message, error_reply)
+            return
         
         # Formatta il nuovo testo (NON modifichiamo il messaggio, solo salviamo)
-        logger.info(f"Offerta registrata: {cifra} crediti da {username}, svincolo {svincolo}")
+        offer_logger.info(
+            "Offerta registrata: %d crediti da %s, svincolo %s", cifra, username, svincolo,
+            extra={'asta': auction_key, 'utente': username, 'offerta': cifra, 'svincolo': svincolo}
+        )
         
-        # Feedback positivo all'utente con conferma
-        try:
-            await message.set_reaction("👍")
-            # Aggiungi anche un messaggio di conferma
-            await message.reply_text(
-                f"✅ **Offerta registrata!**\n\n"
-                f"👤 {username}\n"
-                f"💰 {cifra} crediti\n"
-                f"🔄 Svincolo: {svincolo}"
-            )
-        except Exception as e:
-            logger.warning(f"Impossibile impostare reazione: {e}")
-            # Se la reazione fallisce, rispondi con testo
-            await message.reply_text(
-                f"✅ **Offerta registrata!**\n\n"
-                f"👤 {username}\n"
-                f"💰 {cifra} crediti\n"
-                f"🔄 Svincolo: {svincolo}"
-            )
+        # Conferma all'utente in background: l'offerta è già salvata
+        context.application.create_task(
+            acknowledge_bid(message, context, auction_key, username, cifra, svincolo),
+            update=update
+        )
         
-        # Pianifica la chiusura dell'asta (se JobQueue disponibile)
-        job_name = f"close_auction_{auction_key}"
+        # Ripianifica la chiusura solo se la scadenza è cambiata
+        if scadenza == previous_deadline:
+            return
         
-        # Rimuovi eventuali job precedenti per questa asta
         if context.job_queue:
-            current_jobs = context.job_queue.get_jobs_by_name(job_name)
-            for job in current_jobs:
-                job.schedule_removal()
-            
-            # Pianifica nuovo job
-            context.job_queue.run_once(
-                close_auction,
-                when=AUCTION_DURATION_HOURS * 3600,  # secondi
-                data={'auction_key': auction_key},
-                name=job_name
-            )
-            logger.info(f"Job di chiusura pianificato per {scadenza}")
+            schedule_auction_close(context.job_queue, auction_key, scadenza)
+        else:
+            offer_logger.warning("JobQueue non disponibile")
+
+
+# ============================================================================
+# CONFERMA OFFERTE
+# ============================================================================
+
+# asta -> righe delle offerte in attesa del prossimo riepilogo
+pending_digests: Dict[str, List[str]] = {}
+
+
+def format_bid_confirmation(username: str, cifra: int, svincolo: str) -> str:
+    """Formatta il messaggio di conferma di un'offerta"""
+    return (
+        f"✅ **Offerta registrata!**\n\n"
+        f"👤 {username}\n"
+        f"💰 {cifra} crediti\n"
+        f"🔄 Svincolo: {svincolo}"
+    )
+
+
+async def acknowledge_bid(
+    message: Message,
+    context: ContextTypes.DEFAULT_TYPE,
+    auction_key: str,
+    username: str,
+    cifra: int,
+    svincolo: str
+) -> None:
+    """Conferma un'offerta già salvata secondo CONFIRMATION_POLICY"""
+    confirmation = format_bid_confirmation(username, cifra, svincolo)
+    policy = CONFIRMATION_POLICY
+
+    if policy == "riepilogo":
+        if queue_digest(context, message, auction_key, f"💰 {cifra} - 👤 {username} (🔄 {svincolo})"):
+            policy = "reazione"
         else:
-            logger.warning("JobQueue non disponibile")
+            policy = "entrambi"
+
+    if policy == "risposta":
+        await message.reply_text(confirmation)
+        return
+
+    if policy == "reazione":
+        try:
+            await message.set_reaction("👍")
+        except TelegramError as e:
+            offer_logger.warning("Impossibile impostare reazione: %s", e)
+            # Se la reazione fallisce, rispondi con testo
+            await message.reply_text(confirmation)
+        return
+
+    # Reazione e messaggio in parallelo
+    results = await asyncio.gather(
+        message.set_reaction("👍"),
+        message.reply_text(confirmation),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            offer_logger.warning("Conferma offerta non riuscita: %s", result)
+
+
+def queue_digest(
+    context: ContextTypes.DEFAULT_TYPE,
+    message: Message,
+    auction_key: str,
+    line: str
+) -> bool:
+    """
+    Accoda un'offerta al riepilogo dell'asta, pianificandone l'invio.
+    Ritorna False se il JobQueue non è disponibile.
+    """
+    if not context.job_queue:
+        return False
+
+    lines = pending_digests.setdefault(auction_key, [])
+    lines.append(line)
+
+    if len(lines) == 1:
+        context.job_queue.run_once(
+            send_digest,
+            when=DIGEST_INTERVAL_SECONDS,
+            data={
+                'auction_key': auction_key,
+                'chat_id': message.chat_id,
+                'reply_to': message.reply_to_message.message_id
+            },
+            name=f"digest_{auction_key}"
+        )
+    return True
+
+
+async def send_digest(context: CallbackContext) -> None:
+    """Invia il riepilogo delle offerte ricevute per un'asta"""
+    data = context.job.data
+    lines = pending_digests.pop(data['auction_key'], [])
+    if not lines:
+        return
+
+    try:
+        await context.bot.send_message(
+            chat_id=data['chat_id'],
+            reply_to_message_id=data['reply_to'],
+            text="📣 **Riepilogo offerte**\n\n" + "\n".join(lines)
+        )
+    except TelegramError as e:
+        offer_logger.warning("Impossibile inviare il riepilogo per %s: %s", data['auction_key'], e)
+
+
+# ============================================================================
+# SCADENZE ASTE
+# ============================================================================
+
+def _cap_deadline(created_at: Optional[str], deadline: datetime) -> datetime:
+    """Applica il limite MAX_AUCTION_HOURS dalla creazione dell'asta"""
+    if MAX_AUCTION_HOURS is None or not created_at:
+        return deadline
+    return min(deadline, datetime.fromisoformat(created_at) + timedelta(hours=MAX_AUCTION_HOURS))
+
+
+def initial_deadline(created_at: datetime) -> datetime:
+    """Scadenza di un'asta appena creata"""
+    deadline = created_at + timedelta(hours=AUCTION_DURATION_HOURS)
+    return _cap_deadline(created_at.isoformat(), deadline)
+
+
+def next_deadline(auction: Mapping, now: datetime) -> datetime:
+    """
+    Calcola la scadenza dopo un'offerta valida secondo DEADLINE_POLICY.
+    Le aste create prima dell'introduzione di 'created_at' non hanno limite massimo.
+    """
+    deadline = datetime.fromisoformat(auction['deadline'])
+
+    if DEADLINE_POLICY == "estensione":
+        # Scadenza fissa, prolungata solo per le offerte nella finestra finale
+        if deadline - now <= timedelta(minutes=EXTENSION_WINDOW_MINUTES):
+            deadline = max(deadline, now + timedelta(minutes=EXTENSION_MINUTES))
+    else:
+        deadline = now + timedelta(hours=AUCTION_DURATION_HOURS)
+
+    return _cap_deadline(auction.get('created_at'), deadline)
+
+
+def describe_deadline_policy() -> str:
+    """Descrizione della politica di scadenza per /help"""
+    if DEADLINE_POLICY == "estensione":
+        text = (
+            f"🔄 Le offerte negli ultimi {EXTENSION_WINDOW_MINUTES} minuti "
+            f"prolungano l'asta di {EXTENSION_MINUTES} minuti"
+        )
+    else:
+        text = "🔄 Ogni offerta resetta il timer"
+    if MAX_AUCTION_HOURS is not None:
+        text += f"\n⛔ Durata massima: {MAX_AUCTION_HOURS} ore"
+    return text
+
+
+def schedule_auction_close(job_queue, auction_key: str, deadline: datetime) -> None:
+    """Pianifica (o ripianifica) la chiusura dell'asta alla scadenza indicata"""
+    job_name = f"close_auction_{auction_key}"
+
+    # Rimuovi eventuali job precedenti per questa asta
+    for job in job_queue.get_jobs_by_name(job_name):
+        job.schedule_removal()
+
+    job_queue.run_once(
+        close_auction,
+        when=max(0.0, (deadline - datetime.now()).total_seconds()),
+        data={'auction_key': auction_key},
+        name=job_name
+    )
+    auction_logger.debug("Job di chiusura pianificato per asta %s, scadenza: %s", auction_key, deadline)
 
 
 # ============================================================================
@@ -721,27 +1748,29 @@ async def close_auction(context: CallbackContext) -> None:
     Viene eseguita dal JobQueue.
     """
     auction_key = context.job.data['auction_key']
-    logger.info(f"Chiusura asta {auction_key}")
+    auction_logger.debug("Chiusura asta %s", auction_key)
     
-    # Carica i dati
-    auctions = load_auctions()
-    
-    if auction_key not in auctions:
-        logger.warning(f"Asta {auction_key} non trovata nei dati")
-        return
-    
-    auction = auctions[auction_key]
-    
-    if not auction.get('active', False):
-        logger.info(f"Asta {auction_key} già chiusa")
-        return
+    async with store.write_lock:
+        auction = store.get_for_update(auction_key)
+        
+        if auction is None:
+            auction_logger.warning("Asta %s non trovata nei dati", auction_key)
+            return
+        
+        if not auction.get('active', False):
+            auction_logger.info("Asta %s già chiusa", auction_key)
+            return
+        
+        # Marca l'asta come chiusa
+        auction['active'] = False
+        store.commit({auction_key: auction})
     
-    # Marca l'asta come chiusa
-    auction['active'] = False
-    auctions[auction_key] = auction
-    save_auctions(auctions)
+    update_rosters_after_close(auction)
     
-    logger.info(f"Asta {auction_key} chiusa - Vincitore: {auction['username']}, Offerta: {auction['current_offer']}")
+    auction_logger.info(
+        "Asta %s chiusa - Vincitore: %s, Offerta: %s", auction_key, auction['username'], auction['current_offer'],
+        extra={'asta': auction_key, 'utente': auction['username'], 'offerta': auction['current_offer']}
+    )
 
 
 # ============================================================================
@@ -752,9 +1781,12 @@ async def restart_active_auctions(application: Application) -> None:
     """
     Riavvia i job di chiusura per le aste ancora attive dopo un riavvio del bot.
     """
-    logger.info("Verifica aste attive da riavviare...")
+    store.load()
+    load_rosters()
+    
+    auction_logger.info("Verifica aste attive da riavviare...")
     
-    auctions = load_auctions()
+    auctions = store.snapshot().auctions
     now = datetime.now()
     
     for auction_key, auction in auctions.items():
@@ -766,41 +1798,130 @@ async def restart_active_auctions(application: Application) -> None:
             
             if deadline <= now:
                 # L'asta è già scaduta, chiudila immediatamente
-                logger.info(f"Chiusura immediata asta scaduta {auction_key}")
-                await close_auction_directly(application, auction_key, auction)
+                auction_logger.info("Chiusura immediata asta scaduta %s", auction_key)
+                await close_auction_directly(application, auction_key)
             else:
                 # L'asta è ancora attiva, ripianifica il job
-                time_remaining = (deadline - now).total_seconds()
-                job_name = f"close_auction_{auction_key}"
-                
-                application.job_queue.run_once(
-                    close_auction,
-                    when=time_remaining,
-                    data={'auction_key': auction_key},
-                    name=job_name
-                )
-                logger.info(f"Job ripianificato per asta {auction_key}, scadenza: {deadline}")
+                schedule_auction_close(application.job_queue, auction_key, deadline)
         
         except Exception as e:
-            logger.error(f"Errore nel riavvio asta {auction_key}: {e}")
+            auction_logger.error("Errore nel riavvio asta %s: %s", auction_key, e)
 
 
-async def close_auction_directly(application: Application, auction_key: str, auction: Dict) -> None:
+async def close_auction_directly(application: Application, auction_key: str) -> None:
     """Chiude direttamente un'asta senza usare il job"""
-    auction['active'] = False
-    auctions = load_auctions()
-    auctions[auction_key] = auction
-    save_auctions(auctions)
+    async with store.write_lock:
+        auction = store.get_for_update(auction_key)
+        auction['active'] = False
+        store.commit({auction_key: auction})
+    update_rosters_after_close(auction)
     
-    logger.info(f"Asta {auction_key} chiusa direttamente")
+    auction_logger.info("Asta %s chiusa direttamente", auction_key)
+
+
+# ============================================================================
+# ALTA AFFIDABILITÀ (LEASE)
+# ============================================================================
+
+class LeaderLease:
+    """
+    Lease esclusivo tra istanze che condividono la stessa cartella.
+
+    Il lease è un flock sul LOCK_FILE: il sistema operativo lo rilascia appena
+    il processo attivo termina (anche con kill -9), quindi un'istanza di
+    riserva subentra entro HA_POLL_SECONDS.
+
+    Nel file l'istanza attiva scrive PID e scadenza del lease, rinnovata da un
+    job periodico sul loop asyncio. Se il processo è vivo ma bloccato e la
+    scadenza passa, l'istanza di riserva lo termina con SIGKILL e subentra.
+    Se l'istanza attiva non riesce a rinnovare il lease, si arresta da sola.
+    """
+
+    def __init__(self, path: str = LOCK_FILE) -> None:
+        self.path = path
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        """Prova a prendere il lease senza bloccare"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        # Nessuna scadenza finché il job di heartbeat non parte
+        self.heartbeat(expires=False)
+        return True
+
+    def wait(self) -> None:
+        """Attende il lease: l'istanza resta di riserva finché non lo ottiene"""
+        if self.try_acquire():
+            return
+        ha_logger.info("Istanza di riserva, lease detenuto da: %s", self.holder())
+        while not self.try_acquire():
+            self._fence_stale_holder()
+            time.sleep(HA_POLL_SECONDS)
+
+    def _fence_stale_holder(self) -> None:
+        """Termina l'istanza attiva se il suo lease è scaduto (processo bloccato)"""
+        holder = self.holder()
+        if not holder or not holder.get('expires'):
+            return
+        if datetime.fromisoformat(holder['expires']) > datetime.now():
+            return
+
+        ha_logger.warning(
+            "Lease scaduto: istanza attiva (PID %s) bloccata, terminazione forzata",
+            holder['pid']
+        )
+        try:
+            os.kill(holder['pid'], signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def heartbeat(self, expires: bool = True) -> None:
+        """Aggiorna PID, ultimo heartbeat e scadenza del lease nel file"""
+        now = datetime.now()
+        data = json.dumps({
+            'pid': os.getpid(),
+            'heartbeat': now.isoformat(),
+            'expires': (now + timedelta(seconds=LEASE_TIMEOUT_SECONDS)).isoformat() if expires else None
+        })
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, data.encode('utf-8'), 0)
+
+    def holder(self) -> Optional[Dict]:
+        """Legge le informazioni dell'istanza che detiene il lease"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+async def lease_heartbeat(context: CallbackContext) -> None:
+    """Job periodico: rinnova il lease; se non ci riesce, arresta l'istanza"""
+    try:
+        context.job.data['lease'].heartbeat()
+    except OSError as e:
+        ha_logger.error("Impossibile rinnovare il lease, arresto dell'istanza: %s", e)
+        # run_polling gestisce SIGTERM con un arresto ordinato
+        os.kill(os.getpid(), signal.SIGTERM)
 
 
 # ============================================================================
 # MAIN - AVVIO BOT
 # ============================================================================
 
-def main() -> None:
-    """Avvia il bot"""
+def main(ha: bool = False) -> None:
+    """Avvia il bot (con ha=True in modalità alta affidabilità)"""
     
     # Verifica configurazione
     if BOT_TOKEN == "IL_TUO_TOKEN_QUI":
@@ -811,9 +1932,35 @@ def main() -> None:
         logger.error("ERRORE: Devi configurare il CHANNEL_ID!")
         return
     
+    # Modalità HA: solo chi detiene il lease riceve gli aggiornamenti e
+    # gestisce le scadenze. Le aste vengono caricate dopo aver preso il lease.
+    lease = None
+    if HA_MODE or ha:
+        if fcntl is None:
+            ha_logger.error("ERRORE: La modalità HA richiede un sistema Unix!")
+            return
+        lease = LeaderLease()
+        lease.wait()
+        ha_logger.info("Lease acquisito (PID %d), istanza attiva", os.getpid())
+    
     # Crea l'applicazione
     application = Application.builder().token(BOT_TOKEN).build()
     
+    if lease and application.job_queue:
+        application.job_queue.run_repeating(
+            lease_heartbeat,
+            interval=HEARTBEAT_SECONDS,
+            first=0,
+            data={'lease': lease},
+            name="lease_heartbeat"
+        )
+    elif lease:
+        # Senza heartbeat il lease non scade: subentro solo se il processo termina
+        ha_logger.warning("JobQueue non disponibile, heartbeat del lease disattivato")
+    
+    # Filtro anti-flood, eseguito prima di tutti gli altri handler
+    application.add_handler(TypeHandler(Update, admission_gate), group=-1)
+    
     # Aggiungi handler per i comandi
     application.add_handler(CommandHandler("asta", cmd_asta))
     application.add_handler(CommandHandler("time", cmd_time))
@@ -821,6 +1968,9 @@ def main() -> None:
     application.add_handler(CommandHandler("chiudi", cmd_chiudi))
     application.add_handler(CommandHandler("aste", cmd_aste))
     application.add_handler(CommandHandler("classifica", cmd_classifica))
+    application.add_handler(CommandHandler("rose", cmd_rose))
+    application.add_handler(CommandHandler("esporta", cmd_esporta))
+    application.add_handler(CommandHandler("stato", cmd_stato))
     application.add_handler(CommandHandler("help", cmd_help))
     
     # Aggiungi handler per i messaggi nel gruppo
@@ -840,5 +1990,39 @@ def main() -> None:
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
+def export_main(formato: str, output: Optional[str] = None) -> None:
+    """Esporta lo storico delle aste da riga di comando (su file o stdout)"""
+    if output:
+        with open(output, 'w', encoding='utf-8', newline='') as out:
+            count = export_auctions(formato, out)
+        logger.info("Esportati %d record in %s", count, output)
+    else:
+        export_auctions(formato, sys.stdout)
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """
+    Argomenti da riga di comando:
+    - nessuno: avvia il bot (--ha per la modalità alta affidabilità)
+    - esporta [csv|jsonl] [-o FILE]: esporta lo storico delle aste
+    """
+    parser = argparse.ArgumentParser(description="Bot Telegram per Gestione Asta Fantacalcio")
+    parser.add_argument("--ha", action="store_true", help="Avvia in modalità alta affidabilità (lease condiviso)")
+
+    subparsers = parser.add_subparsers(dest="comando")
+    esporta = subparsers.add_parser("esporta", help="Esporta lo storico delle aste")
+    esporta.add_argument("formato", choices=EXPORT_FORMATS, nargs="?", default="csv")
+    esporta.add_argument("-o", "--output", help="File di destinazione (default: stdout)")
+    return parser
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = build_arg_parser()
+    args = parser.parse_args()
+    
+    if args.comando == 'esporta':
+        if args.ha:
+            parser.error("--ha non è valido con esporta")
+        export_main(args.formato, args.output)
+    else:
+        main(ha=args.ha)
\ No newline at end of file